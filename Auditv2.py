@@ -1,9 +1,13 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import re
 import pdfplumber
 from io import BytesIO
 
+DIM_RE = re.compile(r'(\d+)\s*[xX*]\s*(\d+)')
+NON_NUM_RE = re.compile(r'[^\d.\-]')
+
 # --- Page Setup ---
 st.set_page_config(page_title="PrintShop Analysis Pro", layout="wide")
 st.title("🖨️ Printing Business: Financial & Product Report")
@@ -24,75 +28,100 @@ costs_map = {
     'C2S 80': st.sidebar.number_input("C2S 80 / Book 80", value=1.04),
 }
 
-# --- Numeric Cleaning Function ---
-def clean_num(x):
-    if pd.isna(x) or x == '': return 0.0
-    if isinstance(x, (int, float)): return float(x)
-    s = re.sub(r'[^\d.]', '', str(x))
-    try:
-        return float(s)
-    except:
-        return 0.0
-
 # --- File Loader ---
-def load_and_clean(file):
-    ext = file.name.split('.')[-1].lower()
-    if ext == 'csv': df = pd.read_csv(file)
-    elif ext == 'xlsx': df = pd.read_excel(file)
+@st.cache_data(show_spinner=False, max_entries=2)
+def load_and_clean(file_bytes, name):
+    # Keyed on the raw upload so widget reruns reuse the parsed frame
+    file = BytesIO(file_bytes)
+    ext = name.split('.')[-1].lower()
+    if ext == 'csv': df = pd.read_csv(file, engine='pyarrow', dtype_backend='pyarrow')
+    elif ext == 'xlsx': df = pd.read_excel(file, engine='calamine')
     elif ext == 'pdf':
         with pdfplumber.open(file) as pdf:
-            rows = []
+            header, cols = None, None
             for page in pdf.pages:
                 table = page.extract_table()
-                if table:
-                    if not rows: rows.extend(table)
-                    else: rows.extend(table[1:])
-            df = pd.DataFrame(rows[1:], columns=rows[0]) if rows else None
+                page.close()  # release the page's parsed objects before the next one
+                if not table: continue
+                if header is None:
+                    header, cols = table[0], [[] for _ in table[0]]
+                # Later pages repeat the header row; ragged rows are skipped
+                for row in table[1:]:
+                    if len(row) != len(header): continue
+                    for col, cell in zip(cols, row):
+                        col.append(cell)
+        if header is None: return None
+        df = pd.DataFrame(dict(enumerate(cols)))
+        df.columns = header
     else: return None
 
     df.columns = [str(c).strip() for c in df.columns]
+    df = df.convert_dtypes(dtype_backend='pyarrow')
     for col in ['Total', 'Discount', 'Sales Qty', 'Amount']:
         if col in df.columns:
-            df[col] = df[col].apply(clean_num)
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                raw = df[col]
+                num = pd.to_numeric(raw, errors='coerce', dtype_backend='numpy_nullable').astype('Float64')
+                # Only cells that didn't parse as numbers get the strip, e.g. "-1,200 PHP"; signs are kept
+                retry = num.isna() & raw.notna()
+                if retry.any():
+                    stripped = raw[retry].astype('string').str.replace(NON_NUM_RE, '', regex=True)
+                    num = num.fillna(pd.to_numeric(stripped, errors='coerce', dtype_backend='numpy_nullable').astype('Float64'))
+                df[col] = num
+            df[col] = df[col].fillna(0.0).astype(float)
     
-    df = df[df['Item Name'].notna() & df['Customer Name'].notna()].copy()
+    df = df[df['Item Name'].notna() & df['Customer Name'].notna()]
     
     if 'Sales Date' in df.columns:
-        df['Sales Date'] = pd.to_datetime(df['Sales Date'], errors='coerce', dayfirst=True)
+        dates = df['Sales Date']
+        # Excel/pyarrow may already hand back real timestamps (numpy or Arrow, kind 'M');
+        # only text gets the dayfirst parse
+        if dates.dtype.kind == 'M':
+            if dates.dt.tz is not None:
+                dates = dates.dt.tz_localize(None)
+            dates = dates.astype('datetime64[ns]')
+        else:
+            dates = pd.to_datetime(dates, errors='coerce', dayfirst=True)
+        df = df.assign(**{'Sales Date': dates})
         df = df.dropna(subset=['Sales Date'])
-        df['Month'] = df['Sales Date'].dt.to_period('M')
     return df
 
 # --- Advanced Cost Logic ---
-def run_math(df):
-    dim_pattern = re.compile(r'(\d+)\s*[xX*]\s*(\d+)')
-    def get_costs(row):
-        item = str(row['Item Name']).upper()
-        match = dim_pattern.search(item)
-        if match and 'BANNER' not in item:
-            w, h = int(match.group(1)), int(match.group(2))
-            if w > 100: return (w/1000.0) * (h/1000.0) * plate_rate
-        
-        if 'DIGITAL' in item: return costs_map['Digital Print']
-        if 'STICKER' in item: return costs_map['Sticker']
-        if any(x in item for x in ['C2S 220', 'FC', 'FOLDCOTE']): return costs_map['C2S 220']
-        if 'C2S 180' in item: return costs_map['C2S 180']
-        if 'C2S 140' in item: return costs_map['C2S 140']
-        if 'C2S 120' in item: return costs_map['C2S 120']
-        if 'C2S 80' in item or 'BOOK 80' in item: return costs_map['C2S 80']
-        return 0
-        
-    df['Unit Cost'] = df.apply(get_costs, axis=1)
-    df['Prod Cost'] = df['Unit Cost'] * df['Sales Qty']
-    return df
+@st.cache_data(show_spinner=False, max_entries=2)
+def run_math(df, plate_rate, costs_map):
+    item = df['Item Name'].astype('string[pyarrow]').str.upper()
+
+    # Plates: sized items (W x H, W over 100mm) that are not banners
+    dims = item.str.extract(DIM_RE).astype(float)
+    w, h = dims[0].to_numpy(), dims[1].to_numpy()
+    is_banner = item.str.contains('BANNER', regex=False).to_numpy(dtype=bool, na_value=False)
+    plate_mask = ~is_banner & (w > 100)
+
+    # Plates first, then materials: first matching condition wins
+    conds = [plate_mask] + [m.to_numpy(dtype=bool, na_value=False) for m in (
+        item.str.contains('DIGITAL', regex=False),
+        item.str.contains('STICKER', regex=False),
+        item.str.contains('C2S 220', regex=False) | item.str.contains('FC', regex=False) | item.str.contains('FOLDCOTE', regex=False),
+        item.str.contains('C2S 180', regex=False),
+        item.str.contains('C2S 140', regex=False),
+        item.str.contains('C2S 120', regex=False),
+        item.str.contains('C2S 80', regex=False) | item.str.contains('BOOK 80', regex=False),
+    )]
+    choices = [
+        (w/1000.0) * (h/1000.0) * plate_rate,
+        costs_map['Digital Print'], costs_map['Sticker'], costs_map['C2S 220'],
+        costs_map['C2S 180'], costs_map['C2S 140'], costs_map['C2S 120'], costs_map['C2S 80'],
+    ]
+    unit_cost = np.select(conds, choices, default=0.0)
+    return df.assign(**{'Unit Cost': unit_cost, 'Prod Cost': unit_cost * df['Sales Qty'].to_numpy()})
 
 # --- App Logic ---
 uploaded_file = st.file_uploader("Upload Report (CSV, XLSX, PDF)", type=["csv", "xlsx", "pdf"])
 
 if uploaded_file:
-    df = load_and_clean(uploaded_file)
+    df = load_and_clean(uploaded_file.getvalue(), uploaded_file.name)
     if df is not None:
-        df = run_math(df)
+        df = run_math(df, plate_rate, costs_map)
 
         # Totals
         rev = df['Total'].sum()
@@ -120,14 +149,15 @@ if uploaded_file:
 
         with tab1:
             st.subheader("Monthly Revenue vs Net Profit")
-            monthly = df.groupby('Month').agg({'Total':'sum', 'Prod Cost':'sum'}).reset_index()
+            by_month = df.set_index('Sales Date')[['Total', 'Prod Cost']].resample('MS')
+            monthly = by_month.sum()[by_month.size() > 0]  # months with no sales stay off the chart
             monthly['Profit'] = monthly['Total'] - monthly['Prod Cost'] - monthly_rent
-            monthly['Month_Label'] = monthly['Month'].astype(str)
+            monthly['Month_Label'] = monthly.index.strftime('%Y-%m')
             st.line_chart(monthly.set_index('Month_Label')[['Total', 'Profit']])
 
         with tab2:
             st.subheader("Top 10 Most Profitable Clients")
-            client_data = df.groupby('Customer Name').agg({'Total':'sum', 'Prod Cost':'sum'})
+            client_data = df.groupby('Customer Name', sort=False)[['Total', 'Prod Cost']].sum()
             client_data['Profit'] = client_data['Total'] - client_data['Prod Cost']
             top_10_c = client_data.sort_values('Profit', ascending=False).head(10)
             st.table(top_10_c[['Total', 'Profit']].rename(columns={'Total':'Gross Sales', 'Profit':'Net Profit'}))
@@ -135,11 +165,7 @@ if uploaded_file:
 
         with tab3:
             st.subheader("Product & Services Deep-Dive")
-            product_data = df.groupby('Item Name').agg({
-                'Sales Qty': 'sum',
-                'Total': 'sum',
-                'Prod Cost': 'sum'
-            })
+            product_data = df.groupby('Item Name', sort=False)[['Sales Qty', 'Total', 'Prod Cost']].sum()
             product_data['Net Profit'] = product_data['Total'] - product_data['Prod Cost']
             
             col_a, col_b = st.columns(2)
@@ -159,9 +185,12 @@ if uploaded_file:
             st.divider()
             st.write("### Product Strategic Analysis")
             # Logic to find "High Volume but Low Profit" items
-            product_data['Profit per Unit'] = product_data['Net Profit'] / product_data['Sales Qty']
-            avg_profit_per_unit = product_data['Profit per Unit'].mean()
-            leaks = product_data[(product_data['Profit per Unit'] < (avg_profit_per_unit * 0.5)) & (product_data['Sales Qty'] > 100)]
+            profit = product_data['Net Profit'].to_numpy(dtype=float)
+            qty = product_data['Sales Qty'].to_numpy(dtype=float)
+            ppu = np.divide(profit, qty, out=np.zeros_like(profit), where=qty != 0)
+            threshold = ppu.mean() * 0.5 if len(ppu) else 0.0
+            mask = (ppu < threshold) & (qty > 100)
+            leaks = product_data.iloc[np.flatnonzero(mask)].assign(**{'Profit per Unit': ppu[mask]})
             
             if not leaks.empty:
                 st.warning(f"Found {len(leaks)} high-volume products with very low margins. Consider adjusting prices for these items.")
@@ -175,7 +204,10 @@ if uploaded_file:
             st.write("**Growth Potential:**")
             st.info(f"Shifting volume to your top 3 'Highest Profit Generator' products would scale the business without increasing rent costs.")
 
-        # Export
+        # Export (Month sits before the cost columns, as in earlier exports).
+        # df is the private copy handed back by st.cache_data, so inserting in place is safe.
+        if 'Sales Date' in df.columns:
+            df.insert(df.columns.get_loc('Unit Cost'), 'Month', df['Sales Date'].dt.to_period('M'))
         csv = df.to_csv(index=False).encode('utf-8')
         st.download_button("📥 Download Final Analysis CSV", csv, "Final_Analysis.csv", "text/csv")
 else: